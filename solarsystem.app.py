@@ -9,98 +9,68 @@
 from __future__ import annotations
 import io
 import time
-import base64
-from typing import Tuple, Dict, List
-import requests
-from PIL import Image, ImageDraw
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Optional, Union
+from PIL import Image
 import streamlit as st
 
-# -----------------------------
-# 설정 및 데이터
-# -----------------------------
-PLANETS = [
-    {"id": "mercury", "kr": "수성", "en": "Mercury", "emoji": "🪨", "tip": "회색 바위 표면, 얇은 대기"},
-    {"id": "venus",   "kr": "금성", "en": "Venus",   "emoji": "🌕", "tip": "두꺼운 황산 구름, 황금빛"},
-    {"id": "mars",    "kr": "화성", "en": "Mars",    "emoji": "🔴", "tip": "붉은 사막, 거대한 화산"},
-    {"id": "jupiter", "kr": "목성", "en": "Jupiter", "emoji": "🌀", "tip": "적반점, 가스 거대 행성"},
-    {"id": "saturn",  "kr": "토성", "en": "Saturn",  "emoji": "💍", "tip": "아름다운 고리"},
-    {"id": "uranus",  "kr": "천왕성", "en": "Uranus",  "emoji": "🧊", "tip": "청록빛, 옆으로 누운 자전축"},
-    {"id": "neptune", "kr": "해왕성", "en": "Neptune", "emoji": "🌊", "tip": "짙은 파랑, 강한 바람"},
-]
-PLANET_BY_KR: Dict[str, Dict] = {p["kr"]: p for p in PLANETS}
-
-SCIENCE_FACTS: Dict[str, List[str]] = {
-    "수성": ["암석형 행성, 착륙 가능, 회색 바위와 충돌 크레이터가 많음", "대기가 거의 없음", "극지에 얼음 존재 가능성"],
-    "금성": ["암석형 행성, 착륙 가능, 두꺼운 황산 구름층, 표면 직접 관측 불가", "온실효과로 표면 온도가 매우 높음", "하늘은 황금빛, 지표는 용암평원"],
-    "화성": ["암석형 행성, 착륙 가능, 붉은 산화철 토양, 얇은 대기", "올림푸스 산, 거대한 협곡 존재", "극지방에 얼음 모자"],
-    "목성": ["가스형 거대 행성, 적반점 존재", "강한 대기 흐름과 띠무늬 구름", "고체 표면 없음"],
-    "토성": ["넓은 얼음 고리", "가스형 행성, 연한 황갈색 띠무늬", "여러 위성(타이탄 등) 존재"],
-    "천왕성": ["청록빛, 옆으로 누운 자전축", "메탄으로 인해 푸른색 계열", "차가운 가스/얼음 행성"],
-    "해왕성": ["짙은 파란색, 강한 폭풍과 바람", "어두운 반점 존재", "가스/얼음 혼합 구조"],
-}
-
-IMG_SIZE = "1024x1024"
-MODEL_NAME = "dall-e-3"
-
-# -----------------------------
-# 유틸 함수
-# -----------------------------
-def pil_to_bytes(img: Image.Image, fmt: str = "PNG") -> bytes:
-    buf = io.BytesIO()
-    img.save(buf, format=fmt)
-    return buf.getvalue()
-
-def generate_placeholder_image(title: str, subtitle: str, size: str) -> Image.Image:
-    from random import randint
-    w, h = 1024, 1024
-    img = Image.new("RGB", (w, h), (10, 15, 30))
-    d = ImageDraw.Draw(img)
-    for _ in range(150):
-        x, y = randint(0, w-1), randint(0, h-1)
-        d.ellipse((x, y, x+2, y+2), fill=(255, 255, 255))
-    d.text((30, 40), title, fill=(240, 240, 240))
-    d.text((30, 80), subtitle[:80], fill=(200, 200, 200))
-    return img
-
-# -----------------------------
-# ✅ 수정된 핵심 함수
-# -----------------------------
-def call_openai_image(api_key: str, prompt: str, size: str, model: str) -> Image.Image:
-    """DALL·E 3 호출 (b64_json 고정 + URL 폴백 지원)"""
-    url = "https://api.openai.com/v1/images/generations"
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "n": 1,
-        "size": size,
-        "response_format": "b64_json",  # ★ base64 응답으로 강제
-    }
-
-    r = requests.post(url, headers=headers, json=payload, timeout=90)
-    try:
-        r.raise_for_status()
-    except requests.HTTPError:
-        try:
-            msg = r.json().get("error", {}).get("message", r.text)
-        except Exception:
-            msg = r.text
-        raise RuntimeError(f"HTTP {r.status_code}: {msg}") from None
-
-    j = r.json()
-    data0 = (j.get("data") or [{}])[0]
+from solarsystem.core import (
+    PLANETS,
+    PLANET_BY_KR,
+    PLANET_LABELS,
+    LABEL_TO_PLANET,
+    IMG_SIZE,
+    MODEL_NAME,
+    build_prompt,
+    make_preview,
+    pil_to_bytes,
+    generate_placeholder_image,
+    call_openai_image,
+)
 
-    b64 = data0.get("b64_json")
-    if b64:
-        return Image.open(io.BytesIO(base64.b64decode(b64))).convert("RGB")
+def _executor() -> ThreadPoolExecutor:
+    """API 호출을 UI 스레드 밖에서 실행하기 위한 세션별 스레드 풀
 
-    img_url = data0.get("url")
-    if img_url:
-        resp = requests.get(img_url, timeout=90)
-        resp.raise_for_status()
-        return Image.open(io.BytesIO(resp.content)).convert("RGB")
+    프로세스 공용 풀을 쓰면 다른 학생들의 90초짜리 요청 뒤에서 기다리게 되므로
+    세션마다 따로 둔다. 취소된 요청이 아직 돌고 있어도 새 요청이 막히지 않도록 2개.
+    """
+    if "executor" not in st.session_state:
+        st.session_state.executor = ThreadPoolExecutor(max_workers=2)
+    return st.session_state.executor
 
-    raise RuntimeError("응답에 이미지 데이터가 없습니다. (b64_json/url 모두 없음)")
+def _collect_generation(future: Future) -> None:
+    """끝난 생성 작업의 결과(실패 시 대체 이미지)를 세션에 저장"""
+    st.session_state.future = None
+    done_planet = PLANET_BY_KR[st.session_state.future_planet_kr]
+    try:
+        st.session_state.generated_image_full, st.session_state.generated_png = future.result()
+        st.session_state.notice = ("success", "이미지 생성 완료!")
+    except Exception as e:
+        st.session_state.generated_png = generate_placeholder_image(
+            f"{done_planet['kr']} ({done_planet['en']}) 우주 관광", str(e), IMG_SIZE
+        )
+        st.session_state.generated_image_full = Image.open(io.BytesIO(st.session_state.generated_png))
+        st.session_state.notice = ("error", f"API 오류 발생: {e}")
+    st.session_state.generated_jpeg = None
+    st.session_state.generated_image_preview = make_preview(st.session_state.generated_image_full)
+
+def _cancel_generation() -> None:
+    """'취소' 버튼 콜백 — 화면을 다시 그리기 전에 실행되므로 생성 버튼이 바로 다시 활성화됨"""
+    future = st.session_state.future
+    if future is not None:
+        future.cancel()  # 시작 전이면 실행 취소, 이미 실행 중이면 결과만 버림
+    st.session_state.future = None
+    st.session_state.notice = ("warning", "이미지 생성을 취소했습니다.")
+
+BATCH_WORKERS = 4  # 일괄 생성 시 동시에 보내는 API 요청 수 (요청 한도 고려)
+
+def _show_batch_result(slot, planet: dict, result: Union[Image.Image, str]) -> None:
+    """일괄 생성 결과 한 칸 표시 (성공: 이미지, 실패: 오류 메시지)"""
+    label = f"{planet['emoji']} {planet['kr']} ({planet['en']})"
+    if isinstance(result, str):
+        slot.error(f"{label}: {result}")
+    else:
+        slot.image(result, caption=label, use_column_width=True)
 
 # -----------------------------
 # Streamlit UI
@@ -111,44 +81,63 @@ st.caption("종암중학교 · 과학 수행평가용 · 홍보용 사진 (DALL
 
 if "selected_planet_kr" not in st.session_state:
     st.session_state.selected_planet_kr = "화성"
-if "generated_image" not in st.session_state:
-    st.session_state.generated_image = None
+if "generated_image_full" not in st.session_state:
+    st.session_state.generated_image_full = None  # 원본 크기 (JPEG 변환용)
+    st.session_state.generated_image_preview = None  # 화면 표시용 축소본
+    st.session_state.generated_png = None  # 다운로드용 원본 PNG bytes
+    st.session_state.generated_jpeg = None  # JPEG 다운로드 선택 시 한 번만 변환
+if "future" not in st.session_state:
+    st.session_state.future = None  # 진행 중인 이미지 생성 작업 (Future)
+    st.session_state.future_planet_kr = None
+if "batch_results" not in st.session_state:
+    st.session_state.batch_results = {}  # 행성 id → 미리보기 이미지 또는 오류 메시지
+
+# ---- 끝난 생성 작업은 버튼을 그리기 전에 정리 (같은 실행에서 버튼이 다시 활성화되도록) ----
+future: Optional[Future] = st.session_state.future
+if future is not None and future.done():
+    _collect_generation(future)
+    future = None
 
 # ---- 1) 행성 선택 ----
+# 폼 밖에 두어 선택하자마자 힌트와 최종 프롬프트가 바뀜 (선택은 한 번의 재실행이라 부담 없음)
 st.markdown("### 1) 행성 선택 (지구 제외)")
-planet_labels = [f"{p['kr']} ({p['en']})" for p in PLANETS]
-label_to_planet = {f"{p['kr']} ({p['en']})": p for p in PLANETS}
 current_label = f"{st.session_state.selected_planet_kr} ({PLANET_BY_KR[st.session_state.selected_planet_kr]['en']})"
-if current_label not in planet_labels:
-    current_label = planet_labels[0]
-selected_label = st.selectbox("행성 선택", options=planet_labels, index=planet_labels.index(current_label))
-selected_planet = label_to_planet[selected_label]
+if current_label not in LABEL_TO_PLANET:
+    current_label = PLANET_LABELS[0]
+selected_label = st.selectbox("행성 선택", options=PLANET_LABELS, index=PLANET_LABELS.index(current_label))
+selected_planet = LABEL_TO_PLANET[selected_label]
 st.session_state.selected_planet_kr = selected_planet["kr"]
 st.caption(f"힌트: {selected_planet['kr']} — {selected_planet['tip']}")
 
-# ---- 2) 프롬프트 작성 ----
-st.markdown("### 2) 프롬프트 작성 (필수)")
-st.write("예시) **'화성 협곡 위에 착륙하여 유리돔 리조트에서 우주 관광객들이 로버 투어를 즐기는 장면을 그려줘.'**")
-user_prompt = st.text_area(
-    "홍보용 이미지에 포함하고 싶은 프롬프트를 입력하세요.",
-    value="  ",
-    height=120,
-)
+# ---- 2)~3) 입력: 폼으로 묶어 글자를 입력할 때마다 다시 실행되지 않게 함 ----
+# 폼 안에서는 입력해도 다시 실행되지 않으므로, 버튼 비활성화 여부는 여기서 확정된 값이어야 한다.
+busy = future is not None
+with st.form("generate_form", clear_on_submit=False):
+    # ---- 2) 프롬프트 작성 ----
+    st.markdown("### 2) 프롬프트 작성 (필수)")
+    st.write("예시) **'화성 협곡 위에 착륙하여 유리돔 리조트에서 우주 관광객들이 로버 투어를 즐기는 장면을 그려줘.'**")
+    user_prompt = st.text_area(
+        "홍보용 이미지에 포함하고 싶은 프롬프트를 입력하세요.",
+        value="  ",
+        height=120,
+    )
+
+    # ---- 3) API Key ----
+    st.markdown("### 3) OpenAI API Key (필수, 저장되지 않음)")
+    api_key = st.text_input("OpenAI API Key", type="password")
+
+    st.caption("입력한 아이디어는 '프롬프트 확인' 또는 생성 버튼을 눌러야 아래 최종 프롬프트에 반영됩니다.")
+    st.form_submit_button("🔍 프롬프트 확인 (생성하지 않음)", use_container_width=True)
 
-# ---- 3) API Key ----
-st.markdown("### 3) OpenAI API Key (필수, 저장되지 않음)")
-api_key = st.text_input("OpenAI API Key", type="password")
+    st.markdown("### 4) 이미지 생성")
+    make = st.form_submit_button("✨ 이미지 생성", use_container_width=True, type="primary", disabled=busy)
+    batch = st.form_submit_button("🌌 전체 행성 일괄 생성", use_container_width=True, disabled=busy)
+    if busy and (make or batch):  # 이전 화면에서 눌린 제출은 무시
+        make = batch = False
 
 # ---- 최종 프롬프트 ----
 planet = PLANET_BY_KR[st.session_state.selected_planet_kr]
-facts_text = ", ".join(SCIENCE_FACTS.get(planet["kr"], []))
-final_prompt = (
-    f"'{planet['kr']} ({planet['en']})' 행성의 과학적 사실을 반영한 사실적 사진.\n"
-    f"내용: 우주 관광 여행 상품 홍보용 이미지로, 관광객들이 실제로 행성 위에서 여행을 즐기고 있는 장면을 표현.\n"
-    f"과학적 사실에 기반한 특징: {facts_text}.\n"
-    f"사용자 아이디어: {user_prompt}.\n"
-    f"텍스트나 로고 없이, 바로 사용할 수 있는 고해상도 사진 스타일로."
-)
+final_prompt = build_prompt(planet, user_prompt)
 
 with st.expander("자동으로 구성된 최종 프롬프트 보기"):
     st.code(final_prompt)
@@ -156,38 +145,91 @@ with st.expander("자동으로 구성된 최종 프롬프트 보기"):
 # ---- 4) 이미지 생성 / 미리보기 ----
 col_left, col_right = st.columns([0.48, 0.52])
 with col_left:
-    st.markdown("### 4) 이미지 생성")
-    make = st.button("✨ 이미지 생성", use_container_width=True, type="primary")
+    st.markdown("### 진행 상황")
     if make:
         if not api_key.strip():
             st.warning("API Key를 입력하세요.")
         elif not user_prompt.strip():
             st.warning("프롬프트를 입력하세요.")
         else:
-            try:
-                st.session_state.generated_image = call_openai_image(api_key, final_prompt, IMG_SIZE, MODEL_NAME)
-                st.success("이미지 생성 완료!")
-            except Exception as e:
-                st.session_state.generated_image = generate_placeholder_image(
-                    f"{planet['kr']} ({planet['en']}) 우주 관광", str(e), IMG_SIZE
-                )
-                st.error(f"API 오류 발생: {e}")
+            future = _executor().submit(
+                call_openai_image, api_key, final_prompt, IMG_SIZE, MODEL_NAME, planet["kr"], user_prompt
+            )
+            st.session_state.future = future
+            st.session_state.future_planet_kr = planet["kr"]
+
+    notice = st.session_state.pop("notice", None)
+    if notice is not None:
+        kind, text = notice
+        getattr(st, kind)(text)
+    if future is not None:
+        st.info("⏳ 이미지를 생성하는 중입니다... (최대 90초)")
+        st.button("취소", use_container_width=True, on_click=_cancel_generation)
 
 with col_right:
     st.markdown("### 미리보기")
-    if isinstance(st.session_state.generated_image, Image.Image):
-        st.image(st.session_state.generated_image, use_column_width=True)
+    if isinstance(st.session_state.generated_image_preview, Image.Image):
+        st.image(st.session_state.generated_image_preview, use_column_width=True)
     else:
         st.info("왼쪽에서 '이미지 생성'을 먼저 눌러 주세요.")
 
 # ---- 다운로드 ----
 st.markdown("### 이미지 저장")
-if isinstance(st.session_state.generated_image, Image.Image):
-    data = pil_to_bytes(st.session_state.generated_image)
-    filename = f"{planet['id']}_{int(time.time())}.png"
-    st.download_button("📥 PNG로 다운로드", data=data, file_name=filename, mime="image/png")
+fmt = st.radio("형식", ["PNG", "JPEG"], horizontal=True)
+if st.session_state.generated_png is not None:
+    if fmt == "PNG":
+        data = st.session_state.generated_png
+    else:
+        if st.session_state.generated_jpeg is None:
+            st.session_state.generated_jpeg = pil_to_bytes(st.session_state.generated_image_full, "JPEG")
+        data = st.session_state.generated_jpeg
+    ext = "png" if fmt == "PNG" else "jpg"
+    filename = f"{planet['id']}_{int(time.time())}.{ext}"
+    st.download_button(f"📥 {fmt}로 다운로드", data=data, file_name=filename, mime=f"image/{fmt.lower()}")
 else:
-    st.button("📥 PNG로 다운로드", disabled=True)
+    st.button(f"📥 {fmt}로 다운로드", disabled=True)
+
+# ---- 전체 행성 일괄 생성 ----
+if batch:
+    if not api_key.strip():
+        st.warning("API Key를 입력하세요.")
+        batch = False
+    elif not user_prompt.strip():
+        st.warning("프롬프트를 입력하세요.")
+        batch = False
+if batch or st.session_state.batch_results:
+    st.markdown("### 🌌 전체 행성 일괄 생성")
+    grid = st.columns(4) + st.columns(4)
+    slots = {p["id"]: grid[i].empty() for i, p in enumerate(PLANETS)}
+    results = st.session_state.batch_results
+    if batch:
+        results.clear()
+        # 이 요청 전용 풀 (다른 사용자의 생성과 섞이지 않음, 동시 요청 수는 BATCH_WORKERS로 제한)
+        pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+        try:
+            futures = {
+                pool.submit(
+                    call_openai_image, api_key, build_prompt(p, user_prompt), IMG_SIZE, MODEL_NAME, p["kr"], user_prompt
+                ): p
+                for p in PLANETS
+            }
+            for p in PLANETS:
+                slots[p["id"]].info(f"{p['emoji']} {p['kr']} 생성 중...")
+            for f in as_completed(futures):
+                p = futures[f]
+                try:
+                    full, _ = f.result()  # 일괄 생성은 다운로드가 없으므로 미리보기만 보관
+                    results[p["id"]] = make_preview(full)
+                except Exception as e:
+                    results[p["id"]] = str(e)
+                _show_batch_result(slots[p["id"]], p, results[p["id"]])
+        finally:
+            # 다른 위젯 조작으로 실행이 중단되면 아직 시작하지 않은 요청은 보내지 않음
+            pool.shutdown(wait=False, cancel_futures=True)
+    else:
+        for p in PLANETS:
+            if p["id"] in results:
+                _show_batch_result(slots[p["id"]], p, results[p["id"]])
 
 # ---- 푸터 ----
 st.divider()
@@ -195,3 +237,8 @@ st.markdown(
     f"<div style='text-align:center; color:#94a3b8'>© {time.strftime('%Y')} 종암중학교 · 교육용 데모 · <b>이수민t 제작</b></div>",
     unsafe_allow_html=True,
 )
+
+# ---- 생성 중이면 0.5초 뒤 다시 실행해 결과 확인 ----
+if st.session_state.future is not None:
+    time.sleep(0.5)
+    st.rerun()
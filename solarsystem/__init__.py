@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""우주 관광 여행 상품 이미지 생성기 패키지"""
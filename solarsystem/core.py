@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+우주 관광 여행 상품 이미지 생성기 · 공용 모듈
+- 행성 데이터, 프롬프트용 과학적 사실
+- 이미지 생성(DALL·E 3) / 대체 이미지 / 변환 유틸
+
+Streamlit은 화면 스크립트를 매번 처음부터 다시 실행하지만,
+import된 이 모듈은 프로세스당 한 번만 로드된다.
+"""
+
+from __future__ import annotations
+import io
+import time
+import shutil
+import threading
+from typing import TYPE_CHECKING, Tuple, Dict, List, Optional
+import numpy as np
+from PIL import Image
+import streamlit as st
+
+if TYPE_CHECKING:  # requests는 첫 API 호출 때 import (타입 표기용으로만 참조)
+    import requests
+
+# -----------------------------
+# 설정 및 데이터
+# -----------------------------
+PLANETS = [
+    {"id": "mercury", "kr": "수성", "en": "Mercury", "emoji": "🪨", "tip": "회색 바위 표면, 얇은 대기"},
+    {"id": "venus",   "kr": "금성", "en": "Venus",   "emoji": "🌕", "tip": "두꺼운 황산 구름, 황금빛"},
+    {"id": "mars",    "kr": "화성", "en": "Mars",    "emoji": "🔴", "tip": "붉은 사막, 거대한 화산"},
+    {"id": "jupiter", "kr": "목성", "en": "Jupiter", "emoji": "🌀", "tip": "적반점, 가스 거대 행성"},
+    {"id": "saturn",  "kr": "토성", "en": "Saturn",  "emoji": "💍", "tip": "아름다운 고리"},
+    {"id": "uranus",  "kr": "천왕성", "en": "Uranus",  "emoji": "🧊", "tip": "청록빛, 옆으로 누운 자전축"},
+    {"id": "neptune", "kr": "해왕성", "en": "Neptune", "emoji": "🌊", "tip": "짙은 파랑, 강한 바람"},
+]
+PLANET_BY_KR: Dict[str, Dict] = {p["kr"]: p for p in PLANETS}
+
+SCIENCE_FACTS: Dict[str, List[str]] = {
+    "수성": ["암석형 행성, 착륙 가능, 회색 바위와 충돌 크레이터가 많음", "대기가 거의 없음", "극지에 얼음 존재 가능성"],
+    "금성": ["암석형 행성, 착륙 가능, 두꺼운 황산 구름층, 표면 직접 관측 불가", "온실효과로 표면 온도가 매우 높음", "하늘은 황금빛, 지표는 용암평원"],
+    "화성": ["암석형 행성, 착륙 가능, 붉은 산화철 토양, 얇은 대기", "올림푸스 산, 거대한 협곡 존재", "극지방에 얼음 모자"],
+    "목성": ["가스형 거대 행성, 적반점 존재", "강한 대기 흐름과 띠무늬 구름", "고체 표면 없음"],
+    "토성": ["넓은 얼음 고리", "가스형 행성, 연한 황갈색 띠무늬", "여러 위성(타이탄 등) 존재"],
+    "천왕성": ["청록빛, 옆으로 누운 자전축", "메탄으로 인해 푸른색 계열", "차가운 가스/얼음 행성"],
+    "해왕성": ["짙은 파란색, 강한 폭풍과 바람", "어두운 반점 존재", "가스/얼음 혼합 구조"],
+}
+
+# 화면/프롬프트용 값은 import 시 한 번만 계산
+PLANET_LABELS: Tuple[str, ...] = tuple(f"{p['kr']} ({p['en']})" for p in PLANETS)
+LABEL_TO_PLANET: Dict[str, Dict] = {label: p for label, p in zip(PLANET_LABELS, PLANETS)}
+FACTS_TEXT: Dict[str, str] = {kr: ", ".join(facts) for kr, facts in SCIENCE_FACTS.items()}
+
+PROMPT_TEMPLATE = (
+    "'{kr} ({en})' 행성의 과학적 사실을 반영한 사실적 사진.\n"
+    "내용: 우주 관광 여행 상품 홍보용 이미지로, 관광객들이 실제로 행성 위에서 여행을 즐기고 있는 장면을 표현.\n"
+    "과학적 사실에 기반한 특징: {facts}.\n"
+    "사용자 아이디어: {user}.\n"
+    "텍스트나 로고 없이, 바로 사용할 수 있는 고해상도 사진 스타일로."
+)
+
+# 행성별로 사용자 아이디어(%s)만 비워 둔 최종 프롬프트
+PROMPT_BY_KR: Dict[str, str] = {
+    p["kr"]: PROMPT_TEMPLATE.format(kr=p["kr"], en=p["en"], facts=FACTS_TEXT[p["kr"]].replace("%", "%%"), user="%s")
+    for p in PLANETS
+    if p["kr"] in FACTS_TEXT
+}
+
+IMG_SIZE = "1024x1024"
+MODEL_NAME = "dall-e-3"
+PREVIEW_WIDTH = 512  # 화면 미리보기용 너비 (다운로드는 원본 크기)
+
+# 이미지 캐시 (같은 프롬프트는 그대로, 같은 행성의 비슷한 아이디어는 의미 기반으로 재사용)
+CACHE_TTL = 3600  # 초
+EMBED_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+SEMANTIC_THRESHOLD = 0.92
+SEMANTIC_MAX_ENTRIES = 128
+
+# -----------------------------
+# 유틸 함수
+# -----------------------------
+def build_prompt(planet: Dict, user_prompt: str) -> str:
+    """행성 정보 + 사용자 아이디어로 최종 프롬프트 구성"""
+    return PROMPT_BY_KR[planet["kr"]] % user_prompt
+
+def pil_to_bytes(img: Image.Image, fmt: str = "PNG", compress_level: int = 1) -> bytes:
+    """PIL 이미지 → 파일 bytes (사진이라 압축을 세게 해도 크기 차이가 작아 빠른 설정 사용)"""
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        img.save(buf, format=fmt, compress_level=compress_level)
+    elif fmt == "JPEG":
+        img.save(buf, format=fmt, quality=92, optimize=False, progressive=True)
+    else:
+        img.save(buf, format=fmt)
+    return buf.getvalue()
+
+def make_preview(img: Image.Image, width: int = PREVIEW_WIDTH) -> Image.Image:
+    """미리보기용 축소 이미지 (원본이 더 작으면 그대로)"""
+    if img.width <= width:
+        return img
+    return img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+
+_RNG = np.random.default_rng()
+
+@st.cache_resource(show_spinner=False)
+def _starfield(w: int, h: int) -> Image.Image:
+    """크기별 별 배경 (한 번만 그려 두고 복사해서 사용)"""
+    # 별 150개를 한 번에 배열에 찍기 (십자 모양 3px)
+    arr = np.full((h, w, 3), (10, 15, 30), dtype=np.uint8)
+    ys = _RNG.integers(0, h, 150)
+    xs = _RNG.integers(0, w, 150)
+    arr[ys, xs] = 255
+    arr[np.clip(ys + 1, 0, h - 1), xs] = 255
+    arr[ys, np.clip(xs + 1, 0, w - 1)] = 255
+    return Image.fromarray(arr, "RGB")
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def generate_placeholder_image(title: str, subtitle: str, size: str) -> bytes:
+    """API 오류 시 보여 줄 대체 이미지 (PNG bytes, 같은 오류는 캐시 재사용)"""
+    from PIL import ImageDraw
+    w, h = (int(v) for v in size.split("x"))
+    img = _starfield(w, h).copy()
+    d = ImageDraw.Draw(img)
+    d.text((30, 40), title, fill=(240, 240, 240))
+    d.text((30, 80), subtitle[:80], fill=(200, 200, 200))
+    return pil_to_bytes(img)
+
+# -----------------------------
+# ✅ 수정된 핵심 함수
+# -----------------------------
+@st.cache_resource(show_spinner=False)
+def _http_session() -> requests.Session:
+    """연결 재사용(keep-alive) + 429/5xx 자동 재시도 세션 (첫 API 호출 때 생성)"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class _Retry(Retry):
+        """이미지 생성 POST는 과금되므로 429(요청 한도)일 때만 재시도"""
+
+        def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+            if method.upper() == "POST" and status_code != 429:
+                return False
+            return super().is_retry(method, status_code, has_retry_after)
+
+    retry = _Retry(
+        total=3,
+        read=0,  # 읽기 타임아웃은 재시도하지 않음 (90초 생성 요청이 여러 번 나가는 것 방지)
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,  # 마지막 응답은 그대로 돌려받아 오류 메시지 표시
+    )
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retry))
+    return session
+
+def _parse_json(r) -> dict:
+    """응답 JSON 파싱 (orjson 설치 시 사용 — 큰 b64_json 문자열에서 더 빠름)"""
+    try:
+        import orjson
+    except ImportError:
+        return r.json()
+    try:
+        return orjson.loads(r.content)
+    except orjson.JSONDecodeError:
+        return r.json()
+
+def _b64decode(b64: str) -> bytes:
+    """base64 디코딩 (pybase64 설치 시 SIMD 가속 디코더 사용)"""
+    try:
+        import pybase64
+    except ImportError:
+        import base64
+        return base64.b64decode(b64)
+    return pybase64.b64decode(b64, validate=False)
+
+@st.cache_data(show_spinner=False, max_entries=128, ttl=CACHE_TTL)
+def _call_openai_image_cached(prompt: str, size: str, model: str, _api_key: str) -> bytes:
+    """DALL·E 3 호출 (b64_json 고정 + URL 폴백 지원) → 원본 이미지 bytes
+
+    같은 (prompt, size, model) 요청은 1시간 동안 캐시된 결과를 재사용한다.
+    `_api_key`는 밑줄 접두사라 캐시 키에서 제외된다.
+    """
+    import requests
+
+    url = "https://api.openai.com/v1/images/generations"
+    headers = {"Authorization": f"Bearer {_api_key}", "Content-Type": "application/json"}
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "n": 1,
+        "size": size,
+        "response_format": "b64_json",  # ★ base64 응답으로 강제
+    }
+
+    session = _http_session()
+    r = session.post(url, headers=headers, json=payload, timeout=90)
+    try:
+        r.raise_for_status()
+    except requests.HTTPError:
+        try:
+            msg = r.json().get("error", {}).get("message", r.text)
+        except Exception:
+            msg = r.text
+        raise RuntimeError(f"HTTP {r.status_code}: {msg}") from None
+
+    j = _parse_json(r)
+    r.close()
+    del r  # 응답 본문(약 1.4MB JSON bytes)을 디코딩 전에 해제 → 최대 메모리 감소
+    data0 = (j.get("data") or [{}])[0]
+
+    b64 = data0.get("b64_json")
+    if b64:
+        return _b64decode(b64)
+
+    img_url = data0.get("url")
+    if img_url:
+        with session.get(img_url, timeout=90, stream=True) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True  # gzip 등 전송 인코딩 자동 해제
+            buf = io.BytesIO()
+            shutil.copyfileobj(resp.raw, buf, length=64 * 1024)
+        return buf.getvalue()
+
+    raise RuntimeError("응답에 이미지 데이터가 없습니다. (b64_json/url 모두 없음)")
+
+@st.cache_resource(show_spinner=False)
+def _load_embedder():
+    """다국어 문장 임베딩 모델 (미설치·다운로드 실패 시 None)
+
+    실패해도 None이 캐시되므로 클릭마다 모델 다운로드를 다시 시도하지 않는다.
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBED_MODEL_NAME)
+    except Exception:  # ImportError, 네트워크(OSError), 손상된 파일, torch 오류 등
+        return None
+
+class _PromptCache:
+    """같은 행성 안에서 사용자 아이디어 임베딩의 코사인 유사도로 이전 이미지 검색
+
+    정확히 같은 프롬프트는 `_call_openai_image_cached`(st.cache_data)가 처리하므로
+    여기서는 의미 기반 검색만 맡는다. 항목은 CACHE_TTL이 지나면 버린다.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # (행성, size, model) → [(저장 시각, 아이디어 임베딩, PNG bytes)]
+        self.semantic: Dict[Tuple[str, str, str], List[Tuple[float, np.ndarray, bytes]]] = {}
+
+    def similar(self, key: Tuple[str, str, str], emb: np.ndarray) -> Optional[bytes]:
+        with self.lock:
+            entries = self.semantic.get(key)
+            if entries:
+                cutoff = time.monotonic() - CACHE_TTL
+                entries[:] = [e for e in entries if e[0] > cutoff]
+            if not entries:
+                return None
+            E = np.stack([e for _, e, _ in entries])
+            pngs = [png for _, _, png in entries]
+        sims = E @ emb / (np.linalg.norm(E, axis=1) * np.linalg.norm(emb) + 1e-12)
+        best = int(np.argmax(sims))
+        return pngs[best] if sims[best] > SEMANTIC_THRESHOLD else None
+
+    def store(self, key: Tuple[str, str, str], emb: np.ndarray, png: bytes) -> None:
+        with self.lock:
+            entries = self.semantic.setdefault(key, [])
+            entries.append((time.monotonic(), emb, png))
+            del entries[:-SEMANTIC_MAX_ENTRIES]
+
+@st.cache_resource(show_spinner=False)
+def _prompt_cache() -> _PromptCache:
+    return _PromptCache()
+
+def _embed(text: str) -> Optional[np.ndarray]:
+    embedder = _load_embedder()
+    if embedder is None:
+        return None
+    try:
+        return np.asarray(embedder.encode(text), dtype=np.float32)
+    except Exception:  # 임베딩 실패 시 의미 기반 캐시만 건너뛰고 이미지 생성은 계속
+        return None
+
+def _decode_image(png: bytes) -> Image.Image:
+    """이미지 bytes → RGB PIL 이미지 (pyvips 설치 시 libvips로 디코딩, 이미 RGB면 변환 복사 생략)"""
+    try:
+        import pyvips
+    except (ImportError, OSError):  # OSError: 패키지는 있지만 libvips 라이브러리가 없는 경우
+        pyvips = None
+    if pyvips is not None:
+        try:
+            vimg = pyvips.Image.new_from_buffer(png, "", access="sequential")
+            if vimg.bands == 3 and vimg.format == "uchar":
+                arr = np.ndarray(
+                    buffer=vimg.write_to_memory(), dtype=np.uint8, shape=(vimg.height, vimg.width, vimg.bands)
+                )
+                return Image.fromarray(arr, "RGB")
+        except pyvips.Error:
+            pass  # libvips가 못 읽는 형식이면 PIL로 처리
+
+    img = Image.open(io.BytesIO(png))
+    img.load()  # BytesIO가 사라진 뒤에도 픽셀을 쓸 수 있도록 바로 디코딩
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+def call_openai_image(
+    api_key: str,
+    prompt: str,
+    size: str,
+    model: str,
+    planet_kr: Optional[str] = None,
+    user_prompt: Optional[str] = None,
+) -> Tuple[Image.Image, bytes]:
+    """DALL·E 3 이미지 생성 (동일/유사 프롬프트는 캐시에서 즉시 반환)
+
+    `planet_kr`와 `user_prompt`를 함께 주면 같은 행성에서 비슷한 아이디어로
+    만든 이미지를 재사용한다. 고정 문구가 대부분인 전체 프롬프트 대신
+    사용자 아이디어만 비교해야 다른 행성/다른 아이디어와 섞이지 않는다.
+
+    반환값: (미리보기용 PIL 이미지, 다운로드용 원본 PNG bytes)
+    """
+    emb = None
+    key = (planet_kr, size, model)
+    if planet_kr is not None and user_prompt is not None:
+        emb = _embed(user_prompt.strip())
+        if emb is not None:
+            png = _prompt_cache().similar(key, emb)
+            if png is not None:
+                return _decode_image(png), png
+
+    png = _call_openai_image_cached(prompt, size, model, api_key)
+    if emb is not None:
+        _prompt_cache().store(key, emb, png)
+    return _decode_image(png), png